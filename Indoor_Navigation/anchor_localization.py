@@ -0,0 +1,212 @@
+"""Anchor self-localization from the mesh nodes' peer RSSI reports.
+
+Every non-root node sends "RSSI,<nodeId>,<peer>:<rssi>,..." to the root every
+5 s, which prints it as "[ROOT] Received RSSI report: ...". AnchorLocalizer
+keeps a smoothed pairwise RSSI matrix from those reports and estimates node
+positions with stress minimization (SMACOF), re-solving only when the implied
+distances have changed meaningfully since the last solve, and at most once
+per min_interval.
+"""
+import time
+
+import numpy as np
+
+# Same path loss model as estimate.rssi_to_distance
+TX_POWER = -69  # dBm at 1 m
+PATH_LOSS_EXPONENT = 2
+
+
+def rssi_to_distance(rssi, tx_power=TX_POWER, path_loss_exponent=PATH_LOSS_EXPONENT):
+    return 10 ** ((tx_power - rssi) / (10 * path_loss_exponent))
+
+
+def node_id_from_mac(mac):
+    # painlessMesh derives the node ID from the last four bytes of the MAC
+    octets = [int(part, 16) for part in mac.split(':')]
+    return (octets[2] << 24) | (octets[3] << 16) | (octets[4] << 8) | octets[5]
+
+
+def parse_rssi_report(line):
+    """Return (node_id, {peer_id: rssi}) for an RSSI report line, else None."""
+    start = line.find('RSSI,')
+    if start < 0:
+        return None
+    fields = line[start:].strip().split(',')
+    try:
+        node_id = int(fields[1])
+        peers = {}
+        for field in fields[2:]:
+            peer, rssi = field.split(':')
+            peers[int(peer)] = float(rssi)
+    except (IndexError, ValueError):
+        return None
+    return node_id, peers
+
+
+def pairwise_distances(points):
+    diff = points[:, None, :] - points[None, :, :]
+    return np.sqrt((diff ** 2).sum(axis=-1))
+
+
+class AnchorLocalizer:
+    def __init__(self, smoothing=0.3, change_threshold=0.1, min_interval=10.0, max_iterations=100,
+                 tolerance=1e-4, clock=time.monotonic):
+        self.smoothing = smoothing  # EMA weight of a new report
+        self.change_threshold = change_threshold  # RMS relative distance change that triggers a re-solve
+        self.min_interval = min_interval  # Seconds between solves
+        self.clock = clock
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+
+        self.node_ids = []  # Matrix index -> node ID
+        self.index = {}  # Node ID -> matrix index
+        self.rssi = np.full((0, 0), np.nan)  # rssi[i, j]: what node i heard from node j
+        self.positions = np.zeros((0, 2))
+        self.solved_distances = None
+        self.solved_at = None
+        self.stress = None
+        self.residual = None  # RMS error of the last alignment, in metres
+
+    def _node_index(self, node_id):
+        if node_id not in self.index:
+            n = len(self.node_ids)
+            self.index[node_id] = n
+            self.node_ids.append(node_id)
+            rssi = np.full((n + 1, n + 1), np.nan)
+            rssi[:n, :n] = self.rssi
+            self.rssi = rssi
+            self.positions = np.vstack([self.positions, np.full((1, 2), np.nan)])
+        return self.index[node_id]
+
+    def add_report(self, node_id, peers):
+        i = self._node_index(node_id)
+        for peer, rssi in peers.items():
+            if peer == node_id:
+                continue
+            j = self._node_index(peer)
+            previous = self.rssi[i, j]
+            if np.isnan(previous):
+                self.rssi[i, j] = rssi
+            else:
+                self.rssi[i, j] = previous + self.smoothing * (rssi - previous)
+
+    def ingest(self, line):
+        report = parse_rssi_report(line)
+        if report is None:
+            return False
+        self.add_report(*report)
+        return True
+
+    def distance_matrix(self):
+        # Links are heard from both ends; average the two directions in dBm
+        heard, reverse = self.rssi, self.rssi.T
+        symmetric = np.where(np.isnan(heard), reverse,
+                             np.where(np.isnan(reverse), heard, (heard + reverse) / 2))
+        distances = rssi_to_distance(symmetric)
+        np.fill_diagonal(distances, 0.0)
+        return distances
+
+    def needs_update(self, distances):
+        previous = self.solved_distances
+        if previous is None or previous.shape != distances.shape:
+            return True
+        known = ~np.isnan(distances)
+        if np.any(known != ~np.isnan(previous)):
+            return True
+        # RMS over all links: RSSI noise always moves a few links by more than
+        # the threshold, a moved node shifts many
+        change = np.abs(distances[known] - previous[known]) / np.maximum(previous[known], 1e-6)
+        return bool(np.sqrt((change ** 2).mean()) > self.change_threshold) if change.size else False
+
+    def update(self, force=False):
+        """Re-solve node positions if the distances changed. Returns True if solved."""
+        if len(self.node_ids) < 3:
+            return False
+        now = self.clock()
+        if not force and self.solved_at is not None and now - self.solved_at < self.min_interval:
+            return False
+        distances = self.distance_matrix()
+        if not force and not self.needs_update(distances):
+            return False
+        self.positions, self.stress = self._solve(distances)
+        self.solved_distances = distances
+        self.solved_at = now
+        return True
+
+    def _initial_positions(self, target, weights):
+        positions = self.positions.copy()
+        placed = ~np.isnan(positions).any(axis=1)
+
+        if not placed.any():
+            # Classical MDS, filling unheard pairs with the largest known distance
+            filled = np.where(weights > 0, target, target.max())
+            np.fill_diagonal(filled, 0.0)
+            n = len(filled)
+            centering = np.eye(n) - np.ones((n, n)) / n
+            gram = -0.5 * centering @ (filled ** 2) @ centering
+            values, vectors = np.linalg.eigh(gram)
+            top = np.argsort(values)[::-1][:2]
+            return vectors[:, top] * np.sqrt(np.maximum(values[top], 1e-9))
+
+        # Warm start: new nodes go next to the placed nodes they hear
+        for i in np.flatnonzero(~placed):
+            neighbours = placed & (weights[i] > 0)
+            anchor = positions[neighbours].mean(axis=0) if neighbours.any() else positions[placed].mean(axis=0)
+            angle = 2.399963 * i  # Golden angle keeps new nodes apart
+            radius = target[i, neighbours].mean() if neighbours.any() else 1.0
+            positions[i] = anchor + radius * np.array([np.cos(angle), np.sin(angle)])
+        return positions
+
+    def _solve(self, distances):
+        weights = (~np.isnan(distances)).astype(float)
+        np.fill_diagonal(weights, 0.0)
+        target = np.nan_to_num(distances)
+        positions = self._initial_positions(target, weights)
+
+        v = -weights
+        np.fill_diagonal(v, weights.sum(axis=1))
+        v_pinv = np.linalg.pinv(v)
+
+        stress = None
+        for _ in range(self.max_iterations):
+            current = pairwise_distances(positions)
+            ratio = np.divide(weights * target, current, out=np.zeros_like(current), where=current > 1e-9)
+            b = -ratio
+            np.fill_diagonal(b, ratio.sum(axis=1))
+            positions = v_pinv @ b @ positions  # Guttman transform
+
+            new_stress = (weights * (target - pairwise_distances(positions)) ** 2).sum() / 2
+            if stress is not None and stress - new_stress <= self.tolerance * stress:
+                stress = new_stress
+                break
+            stress = new_stress
+        return positions, stress
+
+    def node_positions(self):
+        return {node_id: tuple(self.positions[i].tolist()) for node_id, i in self.index.items()
+                if not np.isnan(self.positions[i]).any()}
+
+    def aligned_positions(self, reference):
+        """Positions rotated/reflected/translated onto reference {node_id: (x, y)}.
+
+        MDS only recovers the layout up to a rigid motion, so at least three
+        nodes with known coordinates are needed to fix the frame. The RMS
+        distance between the aligned and reference positions is left in
+        self.residual as a quality check.
+        """
+        located = self.node_positions()
+        common = [node_id for node_id in reference if node_id in located]
+        if len(common) < 3:
+            return None
+
+        source = np.array([located[node_id] for node_id in common])
+        destination = np.array([reference[node_id] for node_id in common], dtype=float)
+        source_mean, destination_mean = source.mean(axis=0), destination.mean(axis=0)
+        u, _, vt = np.linalg.svd((source - source_mean).T @ (destination - destination_mean))
+        rotation = u @ vt
+
+        aligned = (source - source_mean) @ rotation + destination_mean
+        self.residual = float(np.sqrt(((aligned - destination) ** 2).sum(axis=1).mean()))
+
+        return {node_id: tuple(((np.array(position) - source_mean) @ rotation + destination_mean).tolist())
+                for node_id, position in located.items()}
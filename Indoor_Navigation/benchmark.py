@@ -0,0 +1,334 @@
+"""Headless benchmark for the estimate.py tracking pipeline.
+
+Generates synthetic RSSI streams from a ground-truth trajectory through the
+anchors in estimate.coordinates, feeds them through a fake serial port in the
+exact "[ROOT] RSSI from MAC <mac>: <rssi>" format the root node prints, and
+times parsing, smoothing/trilateration, Kalman filtering and rendering.
+Device streams run concurrently and interleave on one simulated timeline.
+
+Runs without an ESP32 mesh or a display:
+
+    python benchmark.py --devices 4 --duration 60 --json
+    python benchmark.py --devices 16 --scaling
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import time
+import tracemalloc
+from collections import deque
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+import matplotlib
+matplotlib.use('Agg')  # No display in CI
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import serial
+
+from epoch_fusion import EpochAggregator
+
+
+class SimulatedClock:
+    """Clock for EpochAggregator that follows the synthetic timeline."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSerial:
+    """Stand-in for serial.Serial that replays pre-generated lines."""
+
+    def __init__(self, *args, lines=None, **kwargs):
+        self.lines = deque(lines or [])
+
+    @property
+    def in_waiting(self):
+        return len(self.lines[0]) if self.lines else 0
+
+    def feed(self, lines):
+        self.lines.extend(lines)
+
+    def readline(self):
+        return self.lines.popleft() if self.lines else b''
+
+    def close(self):
+        self.lines.clear()
+
+
+# estimate.py opens its serial port at import time, so swap in the fake first
+serial.Serial = FakeSerial
+import estimate  # noqa: E402
+
+
+def distance_to_rssi(distance):
+    # Inverse of estimate.rssi_to_distance
+    return -69 - 10 * 2 * math.log10(max(distance, 0.01))
+
+
+def trajectory(t, phase=0.0):
+    # Lissajous walk that stays inside the room
+    x = 0.8 * (estimate.ROOM_WIDTH / 2) * math.sin(0.3 * t + phase)
+    y = 0.8 * (estimate.ROOM_HEIGHT / 2) * math.sin(0.2 * t + 2 * phase)
+    return x, y
+
+
+def device_phase(device):
+    return device * 2 * math.pi / 7
+
+
+def generate_device_stream(device, duration, rate, noise, dropout, rng):
+    """Yield (time, [(mac, rssi, serial_line), ...]) once per sampling step."""
+    phase = device_phase(device)
+    for step in range(int(duration * rate)):
+        t = step / rate
+        true_x, true_y = trajectory(t, phase)
+        samples = []
+        for mac, (ax, ay) in estimate.coordinates.items():
+            if rng.random() < dropout:
+                continue
+            rssi = distance_to_rssi(math.hypot(true_x - ax, true_y - ay))
+            rssi = int(round(rssi + rng.gauss(0, noise)))
+            samples.append((mac, rssi, f"[ROOT] RSSI from MAC {mac}: {rssi}\r\n".encode('utf-8')))
+        yield t, samples
+
+
+def make_app(clock, epoch_length):
+    # TrackingApp without Tk: an Agg canvas stands in for the Tk one
+    app = estimate.TrackingApp.__new__(estimate.TrackingApp)
+    app._init_state(history_dir=None, epoch_length=epoch_length, clock=clock)
+    app.fig = Figure(figsize=(8, 6))
+    app.canvas = FigureCanvasAgg(app.fig)
+    return app
+
+
+def timed(func, timings):
+    # Wrap one of the app's stage methods so every call is timed
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+        return result
+    return wrapper
+
+
+def scored(app, record_position, phase, errors):
+    # Score each recorded fix against the ground-truth trajectory
+    def record_and_score(epoch):
+        record_position(epoch)
+        true_x, true_y = trajectory((epoch.start + epoch.end) / 2, phase)
+        errors.append(math.hypot(app.position[0] - true_x, app.position[1] - true_y))
+    return record_and_score
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(timings):
+    return {
+        'calls': len(timings),
+        'mean_us': 1e6 * sum(timings) / len(timings) if timings else 0.0,
+        'p50_us': 1e6 * percentile(timings, 50),
+        'p95_us': 1e6 * percentile(timings, 95),
+        'total_s': sum(timings),
+    }
+
+
+def run_benchmark(devices=4, duration=30.0, rate=10.0, noise=4.0, dropout=0.1,
+                  epoch_length=0.2, render_every=50, seed=0, trace_memory=False):
+    """Run all device streams concurrently on one simulated timeline.
+
+    The root's "[ROOT] RSSI from MAC" lines carry no device field, so each
+    wearable gets its own TrackingApp (as if on its own root/serial port) and
+    their lines are interleaved in arrival order. The same samples, tagged
+    with the device, also go through one shared EpochAggregator and a batched
+    trilaterate over its multi-device rows ('batch_*' stages).
+    """
+    rng = random.Random(seed)
+    fake = FakeSerial()
+    estimate.ser = fake
+    clock = SimulatedClock()
+
+    stages = {'parse': [], 'fuse': [], 'trilaterate': [], 'kalman': [], 'history': [],
+              'batch_fuse': [], 'batch_solve': [], 'render': []}
+    errors = []
+    samples = 0
+    batch_rows = []
+
+    apps = []
+    for device in range(devices):
+        app = make_app(clock, epoch_length)
+        app.read_serial_data = timed(app.read_serial_data, stages['parse'])
+        app.epochs.poll = timed(app.epochs.poll, stages['fuse'])
+        app.trilaterate = timed(app.trilaterate, stages['trilaterate'])
+        app.filter_position = timed(app.filter_position, stages['kalman'])
+        app.record_position = scored(app, timed(app.record_position, stages['history']),
+                                     device_phase(device), errors)
+        apps.append(app)
+    shared = EpochAggregator(estimate.coordinates.keys(), epoch_length=epoch_length, clock=clock)
+    shared_poll = timed(shared.poll, stages['batch_fuse'])
+    streams = [generate_device_stream(device, duration, rate, noise, dropout, rng)
+               for device in range(devices)]
+
+    # tracemalloc slows every allocation, so only trace when asked to
+    if trace_memory:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    # read_serial_data prints every sample; keep that cost but not the output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for step, device_steps in enumerate(zip(*streams)):
+            clock.now = device_steps[0][0]
+            arrivals = [(device, sample) for device, (_, device_samples) in enumerate(device_steps)
+                        for sample in device_samples]
+            rng.shuffle(arrivals)  # Devices' lines interleave on the wire
+            samples += len(arrivals)
+
+            # One line at a time so 'parse' is per-sample latency
+            for device, (mac, rssi, line) in arrivals:
+                fake.feed([line])
+                apps[device].read_serial_data()
+                shared.add(mac, rssi, device=device)
+
+            for app in apps:
+                app.update_position()
+
+            for epoch in shared_poll():
+                batch_rows.append(len(epoch.devices))
+                start = time.perf_counter()
+                estimate.TrackingApp.trilaterate(apps[0], epoch.rssi)
+                stages['batch_solve'].append(time.perf_counter() - start)
+
+            # One GUI, showing the first device
+            if render_every and step % render_every == 0:
+                start = time.perf_counter()
+                apps[0].update_display(is_calibrating=False)
+                stages['render'].append(time.perf_counter() - start)
+        for app in apps:
+            app.fig.clf()
+    wall = time.perf_counter() - wall_start
+    peak_traced = None
+    if trace_memory:
+        peak_traced = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    # ru_maxrss is KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+
+    pipeline_time = sum(sum(t) for name, t in stages.items()
+                        if name != 'render' and not name.startswith('batch_'))
+    return {
+        'config': {
+            'devices': devices, 'duration_s': duration, 'rate_hz': rate,
+            'noise_db': noise, 'dropout': dropout, 'epoch_length_s': epoch_length,
+            'render_every': render_every, 'seed': seed,
+        },
+        'samples': samples,
+        'fixes': len(errors),
+        'wall_s': wall,
+        'samples_per_sec': samples / pipeline_time if pipeline_time else 0.0,
+        'batch_rows_mean': sum(batch_rows) / len(batch_rows) if batch_rows else 0.0,
+        'stages': {name: summarize(t) for name, t in stages.items()},
+        'peak_rss_kb': peak_rss,
+        'peak_traced_kb': peak_traced,
+        'error_m': {
+            'mean': sum(errors) / len(errors) if errors else 0.0,
+            'rmse': math.sqrt(sum(e * e for e in errors) / len(errors)) if errors else 0.0,
+            'p95': percentile(errors, 95),
+            'max': max(errors) if errors else 0.0,
+        },
+    }
+
+
+def print_report(result):
+    config = result['config']
+    print(f"Devices: {config['devices']}, {config['duration_s']:.0f}s at {config['rate_hz']:.0f} Hz, "
+          f"noise {config['noise_db']} dB, dropout {config['dropout']:.0%}")
+    print(f"Samples: {result['samples']}  Fixes: {result['fixes']}  Wall: {result['wall_s']:.2f}s")
+    print(f"Throughput (excl. render): {result['samples_per_sec']:.0f} samples/sec")
+    print(f"Shared aggregator: {result['batch_rows_mean']:.1f} device rows per epoch")
+    if result['peak_rss_kb'] is not None:
+        print(f"Peak RSS: {result['peak_rss_kb']:.0f} KiB")
+    if result['peak_traced_kb'] is not None:
+        print(f"Peak traced Python memory: {result['peak_traced_kb']:.0f} KiB")
+    print(f"{'stage':<12}{'calls':>8}{'mean us':>12}{'p50 us':>12}{'p95 us':>12}")
+    for name, stats in result['stages'].items():
+        print(f"{name:<12}{stats['calls']:>8}{stats['mean_us']:>12.1f}"
+              f"{stats['p50_us']:>12.1f}{stats['p95_us']:>12.1f}")
+    error = result['error_m']
+    print(f"Position error (m): mean {error['mean']:.3f}, rmse {error['rmse']:.3f}, "
+          f"p95 {error['p95']:.3f}, max {error['max']:.3f}")
+
+
+def run_scaling(max_devices, **options):
+    """Run with 1, 2, 4, ... max_devices concurrent devices."""
+    counts = []
+    devices = 1
+    while devices < max_devices:
+        counts.append(devices)
+        devices *= 2
+    counts.append(max_devices)
+    return [run_benchmark(devices=devices, **options) for devices in counts]
+
+
+def print_scaling(results):
+    print(f"{'devices':>8}{'samples/s':>12}{'parse us':>10}{'solve us':>10}"
+          f"{'rows/epoch':>12}{'batch us':>10}{'us/row':>8}")
+    for result in results:
+        stages = result['stages']
+        rows = result['batch_rows_mean']
+        batch = stages['batch_solve']['mean_us']
+        print(f"{result['config']['devices']:>8}{result['samples_per_sec']:>12.0f}"
+              f"{stages['parse']['mean_us']:>10.1f}{stages['trilaterate']['mean_us']:>10.1f}"
+              f"{rows:>12.1f}{batch:>10.1f}{batch / rows if rows else 0.0:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tracking pipeline on synthetic RSSI")
+    parser.add_argument('--devices', type=int, default=4, help="number of simulated wearables")
+    parser.add_argument('--duration', type=float, default=30.0, help="simulated seconds")
+    parser.add_argument('--rate', type=float, default=10.0, help="sampling steps per second")
+    parser.add_argument('--noise', type=float, default=4.0, help="RSSI noise std-dev in dB")
+    parser.add_argument('--dropout', type=float, default=0.1, help="probability a sample is lost")
+    parser.add_argument('--epoch-length', type=float, default=0.2, help="fusion window in seconds")
+    parser.add_argument('--render-every', type=int, default=50, help="render every N steps (0 disables)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="track peak Python allocations (slows every stage)")
+    parser.add_argument('--scaling', action='store_true',
+                        help="repeat with 1, 2, 4, ... --devices devices and compare")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    options = dict(duration=args.duration, rate=args.rate, noise=args.noise, dropout=args.dropout,
+                   epoch_length=args.epoch_length, render_every=args.render_every, seed=args.seed,
+                   trace_memory=args.trace_memory)
+    if args.scaling:
+        results = run_scaling(args.devices, **options)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_scaling(results)
+        return
+
+    result = run_benchmark(args.devices, **options)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
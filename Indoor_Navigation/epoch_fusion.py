@@ -0,0 +1,96 @@
+"""Time-aligned fusion of per-anchor RSSI samples.
+
+Samples are timestamped on arrival and binned into fixed-length epochs. When an
+epoch closes, each device gets one RSSI row with an entry per anchor: the mean
+of that anchor's samples in the epoch, the anchor's last value if it was heard
+within max_age, or NaN if it has gone stale. The solver then runs once per
+epoch instead of once per serial line.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# rssi and counts have one row per device and one column per anchor
+Epoch = namedtuple('Epoch', ['start', 'end', 'devices', 'rssi', 'counts'])
+
+
+class EpochAggregator:
+    def __init__(self, anchors, epoch_length=0.2, max_age=2.0, clock=time.monotonic):
+        self.anchors = list(anchors)
+        self.anchor_index = {mac: i for i, mac in enumerate(self.anchors)}
+        self.epoch_length = epoch_length  # seconds
+        self.max_age = max_age  # seconds an anchor's last value stays usable
+        self.clock = clock
+
+        self.current = None  # Index of the open epoch
+        self.devices = []  # Row -> device
+        self.device_index = {}  # Device -> row
+        n = len(self.anchors)
+        self.sums = np.zeros((0, n))
+        self.counts = np.zeros((0, n), dtype=int)
+        self.last_rssi = np.full((0, n), np.nan)
+        self.last_seen = np.full((0, n), -np.inf)
+        self.ready = []
+
+    def _device_row(self, device):
+        if device not in self.device_index:
+            self.device_index[device] = len(self.devices)
+            self.devices.append(device)
+            n = len(self.anchors)
+            self.sums = np.vstack([self.sums, np.zeros((1, n))])
+            self.counts = np.vstack([self.counts, np.zeros((1, n), dtype=int)])
+            self.last_rssi = np.vstack([self.last_rssi, np.full((1, n), np.nan)])
+            self.last_seen = np.vstack([self.last_seen, np.full((1, n), -np.inf)])
+        return self.device_index[device]
+
+    def add(self, mac, rssi, device='wearable', timestamp=None):
+        """Record one sample; returns False for unknown anchors."""
+        column = self.anchor_index.get(mac)
+        if column is None:
+            return False
+        if timestamp is None:
+            timestamp = self.clock()
+
+        epoch = int(timestamp // self.epoch_length)
+        if self.current is None:
+            self.current = epoch
+        elif epoch > self.current:
+            self._close()
+            self.current = epoch
+        # Late samples (epoch < current) are counted in the open epoch
+
+        row = self._device_row(device)
+        self.sums[row, column] += rssi
+        self.counts[row, column] += 1
+        self.last_seen[row, column] = max(self.last_seen[row, column], timestamp)
+        return True
+
+    def poll(self, now=None):
+        """Close the open epoch if its window has passed and return finished epochs."""
+        if now is None:
+            now = self.clock()
+        if self.current is not None and now >= (self.current + 1) * self.epoch_length:
+            self._close()
+            self.current = None
+        ready, self.ready = self.ready, []
+        return ready
+
+    def _close(self):
+        start = self.current * self.epoch_length
+        end = start + self.epoch_length
+
+        heard = self.counts > 0
+        means = np.divide(self.sums, self.counts, out=np.full(self.sums.shape, np.nan), where=heard)
+        self.last_rssi[heard] = means[heard]
+
+        # Anchors missing from this epoch fall back to their last value until it ages out
+        recent = self.last_seen >= end - self.max_age
+        rssi = np.where(heard, means, np.where(recent, self.last_rssi, np.nan))
+
+        active = heard.any(axis=1)
+        if active.any():
+            self.ready.append(Epoch(start, end, [self.devices[i] for i in np.flatnonzero(active)],
+                                    rssi[active], self.counts[active]))
+        self.sums[:] = 0
+        self.counts[:] = 0
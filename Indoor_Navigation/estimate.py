@@ -1,6 +1,7 @@
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.animation import FuncAnimation
+from matplotlib.patches import Rectangle
 import serial
 import time
 from collections import deque
@@ -8,6 +9,9 @@ import math
 import tkinter as tk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from tkinter import ttk
+from anchor_localization import AnchorLocalizer, node_id_from_mac
+from epoch_fusion import EpochAggregator
+from position_history import PositionHistory
 
 # Serial port configuration
 ser = serial.Serial('COM10', 115200)
@@ -22,6 +26,27 @@ coordinates = {
     'F2:09:0D:44:77:58': (1, -1.5)
 }
 
+# Locate anchors from the nodes' peer RSSI reports. The hand-measured
+# coordinates above only fix the room frame (rotation, reflection, offset);
+# a solution is rejected as a bad fit (e.g. a folded layout) when its RMS
+# distance from them exceeds a quarter of the room diagonal.
+AUTO_LOCATE_ANCHORS = False
+MAX_ANCHOR_RESIDUAL = 0.25 * math.hypot(ROOM_WIDTH, ROOM_HEIGHT)  # meters
+
+# Bathroom zones (x_min, y_min, x_max, y_max), laid out like SEGMENTS in
+# voice_assistant.py with the Shower/Basin row at the top
+ZONES = {
+    'Shower': (-1.0, 0.0, 0.0, 1.5),
+    'Basin': (0.0, 0.0, 1.0, 1.5),
+    'Entrance': (-1.0, -1.5, 0.0, 0.0),
+    'Toilet': (0.0, -1.5, 1.0, 0.0),
+}
+
+# Position history: fixes are kept on disk for trails and dwell-time analytics
+HISTORY_DIR = 'history'  # None keeps history in memory only
+TRAIL_SECONDS = 60
+DWELL_REFRESH_SECONDS = 10  # Today's per-zone dwell times are a full scan of the day
+
 # RSSI averaging buffers
 rssi_buffers = {mac: deque(maxlen=5) for mac in coordinates.keys()}
 
@@ -90,12 +115,7 @@ class TrackingApp:
         self.root = root
         self.root.title("Position Tracking")
         
-        # Initialize variables
-        self.is_calibrating = False
-        self.baseline_rssi = {mac: deque(maxlen=100) for mac in coordinates.keys()}
-        self.baseline_values = None
-        self.rssi_buffers = {mac: deque(maxlen=5) for mac in coordinates.keys()}
-        self.serial_logs = []
+        self._init_state()
         
         # Print initial state
         print("Initial state:")
@@ -105,6 +125,24 @@ class TrackingApp:
         # Create GUI elements
         self.setup_gui()
         
+    def _init_state(self, history_dir=HISTORY_DIR, **epoch_options):
+        # Tracking state that doesn't need Tk, so it can run headless
+        self.is_calibrating = False
+        self.baseline_rssi = {mac: deque(maxlen=100) for mac in coordinates.keys()}
+        self.baseline_values = None
+        self.rssi_buffers = {mac: deque(maxlen=5) for mac in coordinates.keys()}
+        self.serial_logs = []
+        self.anchor_localizer = AnchorLocalizer()
+        self.anchor_reference = {node_id_from_mac(mac): pos for mac, pos in coordinates.items()}
+        self.epochs = EpochAggregator(coordinates.keys(), **epoch_options)
+        self.position = (0.0, 0.0)
+        self.history = PositionHistory(history_dir)
+        # Epochs are timed on the aggregator's (monotonic) clock; fix the offset
+        # to wall time once so clock adjustments can't reorder the history
+        self.wall_offset = time.time() - self.epochs.clock()
+        self.dwell = {}  # Zone -> seconds spent there today
+        self.dwell_updated = 0.0
+        
         # Initialize Kalman filter
         self.kalman = KalmanFilter2D()
         
@@ -226,10 +264,12 @@ class TrackingApp:
             return
         
         self.read_serial_data()
+        self.update_position()
         self.update_display(is_calibrating=False)
 
     def read_serial_data(self):
-        if ser.in_waiting:
+        # Drain everything waiting; samples are timestamped as they arrive
+        while ser.in_waiting:
             try:
                 raw_data = ser.readline()
                 line = raw_data.decode('utf-8').strip()
@@ -245,32 +285,73 @@ class TrackingApp:
                     
                     if mac in self.rssi_buffers:
                         self.rssi_buffers[mac].append(rssi)
+                        self.epochs.add(mac, rssi)
                         print(f"Tracking RSSI for {mac}: {rssi}")
+                elif line.startswith('[ROOT] Received RSSI report'):
+                    if self.anchor_localizer.ingest(line) and AUTO_LOCATE_ANCHORS:
+                        self.relocate_anchors()
             except UnicodeDecodeError:
                 print(f"Error decoding data: {raw_data}")
-                return
+                continue
             except Exception as e:
                 print(f"Error in read_serial_data: {str(e)}")
-                return
+                continue
 
-    def trilaterate(self):
-        # Get smoothed RSSI values
-        smoothed_rssi = {mac: sum(buffer)/len(buffer) if buffer else -100 
-                        for mac, buffer in self.rssi_buffers.items()}
-        
-        # Convert to distances
-        distances = {mac: rssi_to_distance(rssi) 
-                    for mac, rssi in smoothed_rssi.items()}
+    def relocate_anchors(self):
+        # Only re-solves when the peer distances changed meaningfully
+        if not self.anchor_localizer.update():
+            return
+        located = self.anchor_localizer.aligned_positions(self.anchor_reference)
+        if located is None:
+            return
+        residual = self.anchor_localizer.residual
+        if residual > MAX_ANCHOR_RESIDUAL:
+            print(f"Ignoring anchor solution: {residual:.2f} m from measured coordinates")
+            return
+        for mac in coordinates.keys():
+            node_id = node_id_from_mac(mac)
+            if node_id in located:
+                # Anchors are mounted inside the room
+                x_pos = min(max(located[node_id][0], -ROOM_WIDTH/2), ROOM_WIDTH/2)
+                y_pos = min(max(located[node_id][1], -ROOM_HEIGHT/2), ROOM_HEIGHT/2)
+                coordinates[mac] = (x_pos, y_pos)
+                print(f"Anchor {mac} located at ({x_pos:.2f}, {y_pos:.2f})")
+
+    def trilaterate(self, rssi):
+        # rssi has one row per device and one column per anchor (NaN = not heard)
+        anchors = np.array([coordinates[mac] for mac in self.epochs.anchors])
         
         # Simple weighted average of anchor positions
-        total_weight = sum(1/d for d in distances.values() if d > 0)
-        if total_weight == 0:
-            return 0, 0
+        distances = rssi_to_distance(rssi)
+        weights = np.where(np.isnan(distances), 0.0, 1 / distances)
+        total_weight = weights.sum(axis=1, keepdims=True)
         
-        x_pos = sum(coordinates[mac][0] * (1/d) for mac, d in distances.items() if d > 0) / total_weight
-        y_pos = sum(coordinates[mac][1] * (1/d) for mac, d in distances.items() if d > 0) / total_weight
-        
-        return x_pos, y_pos
+        return np.divide(weights @ anchors, total_weight,
+                         out=np.zeros((len(rssi), 2)), where=total_weight > 0)
+
+    def update_position(self):
+        # One solve per finished epoch, however many lines arrived in it
+        for epoch in self.epochs.poll():
+            raw_x, raw_y = self.trilaterate(epoch.rssi)[0]
+            self.filter_position(raw_x, raw_y)
+            self.record_position(epoch)
+
+    def filter_position(self, raw_x, raw_y):
+        self.position = self.kalman.update(raw_x, raw_y)
+
+    def record_position(self, epoch):
+        device = epoch.devices[0]
+        timestamp = self.wall_offset + epoch.end
+        last = self.history.last_timestamp(device)
+        if last is not None and timestamp < last:
+            # e.g. history on disk written while the wall clock was ahead
+            print(f"Skipping out-of-order fix for {device}: {timestamp:.1f} < {last:.1f}")
+            return
+        try:
+            self.history.append(device, timestamp, *self.position)
+        except OSError as e:
+            # Losing a fix is better than stopping the tracking animation
+            print(f"Error recording position: {str(e)}")
 
     def update_display(self, is_calibrating=False):
         self.fig.clf()
@@ -322,9 +403,26 @@ class TrackingApp:
         
         if not is_calibrating:
             # Only show position during tracking
-            raw_x, raw_y = self.trilaterate()
-            x_pos, y_pos = self.kalman.update(raw_x, raw_y)
+            x_pos, y_pos = self.position
+            # Trails cover the last TRAIL_SECONDS up to now, so a device that
+            # dropped out (or a previous session) fades off the map
+            trail_start = self.wall_offset + self.epochs.clock() - TRAIL_SECONDS
+            for device in self.history.devices:
+                last = self.history.last_timestamp(device)
+                if last is None or last < trail_start:
+                    continue
+                # Downsampled so long trails don't slow the redraw
+                trail_t, trail_x, trail_y = self.history.trail(device, start=trail_start, max_points=200)
+                ax.plot(trail_x, trail_y, c='blue', alpha=0.4)
             ax.scatter(x_pos, y_pos, c='blue', s=200, marker='x')
+            
+            # Zones with the time spent in each today
+            self.refresh_dwell()
+            for name, (x_min, y_min, x_max, y_max) in ZONES.items():
+                ax.add_patch(Rectangle((x_min, y_min), x_max - x_min, y_max - y_min,
+                                       fill=False, linestyle='--', edgecolor='gray'))
+                ax.text(x_min + 0.05, y_min + 0.05, f"{name}: {self.dwell.get(name, 0) / 60:.0f} min today",
+                        fontsize=8, color='gray')
         
         ax.set_title('Calibrating...' if is_calibrating else 'Live Position Tracking')
         ax.set_xlabel('X Coordinate (m)')
@@ -335,6 +433,18 @@ class TrackingApp:
         
         self.canvas.draw()
 
+    def refresh_dwell(self):
+        now = time.time()
+        if now - self.dwell_updated < DWELL_REFRESH_SECONDS:
+            return
+        self.dwell_updated = now
+        
+        midnight = time.mktime(time.localtime(now)[:3] + (0, 0, 0, 0, 0, -1))
+        self.dwell = {}
+        for device in self.history.devices:
+            for name, seconds in self.history.dwell_times(device, ZONES, start=midnight).items():
+                self.dwell[name] = self.dwell.get(name, 0) + seconds
+
     def log_serial_data(self, line):
         self.serial_logs.append(line)
         if len(self.serial_logs) > 1000:  # Keep last 1000 lines
@@ -352,4 +462,5 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = TrackingApp(root)
     root.mainloop()
+    app.history.flush()
     ser.close()
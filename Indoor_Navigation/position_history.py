@@ -0,0 +1,282 @@
+"""Append-only position history with downsampled trails and range queries.
+
+Fixes are stored per device in columnar arrays (t, x, y) split into fixed
+time partitions, so range queries only touch the partitions they overlap.
+Given a directory, each partition column is a .npy memmap and the history
+survives restarts:
+
+    history/<device>/<partition>/t.npy, x.npy, y.npy
+"""
+import contextlib
+import math
+import os
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+COLUMNS = {'t': np.float64, 'x': np.float32, 'y': np.float32}
+
+
+def bucket_means(columns, size):
+    """Average each column over consecutive buckets of size rows (last may be short)."""
+    n = len(columns[0])
+    if size <= 1 or n == 0:
+        return tuple(np.asarray(column, dtype=np.float64) for column in columns)
+    starts = np.arange(0, n, size)
+    counts = np.diff(np.append(starts, n))
+    return tuple(np.add.reduceat(column, starts, dtype=np.float64) / counts for column in columns)
+
+
+class Partition:
+    """One time partition of a device's history.
+
+    On-disk partitions are only memory-mapped while in use (see opened()) so a
+    long history doesn't hold three file descriptors per partition; the
+    partition being appended to stays open until it is sealed.
+    """
+
+    def __init__(self, path=None, capacity=4096):
+        self.path = path
+        self.sealed = False  # No more appends; downsampled levels can be cached
+        self.levels = {}
+        self.columns = None
+        self.length = 0
+        self.last_timestamp = None
+
+        if path and os.path.exists(self._column_path('t')):
+            with self.opened():
+                # Unused slots hold NaN, which sorts after every timestamp. A crash
+                # mid-grow can leave t longer than x/y, so trust the shortest.
+                self.length = min(int(np.searchsorted(self.columns['t'], np.inf, side='right')),
+                                  len(self.columns['x']), len(self.columns['y']))
+                if self.length:
+                    self.last_timestamp = float(self.columns['t'][self.length - 1])
+        elif path:
+            os.makedirs(path, exist_ok=True)
+            for name in COLUMNS:
+                self._write_column(name, capacity)
+        else:
+            self.columns = {name: self._empty_column(name, capacity) for name in COLUMNS}
+
+    @staticmethod
+    def is_complete(path):
+        return all(os.path.exists(os.path.join(path, f'{name}.npy')) for name in COLUMNS)
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f'{name}.npy')
+
+    @staticmethod
+    def _empty_column(name, capacity):
+        column = np.empty(capacity, dtype=COLUMNS[name])
+        column[:] = np.nan
+        return column
+
+    def _write_column(self, name, capacity, data=None):
+        # Write beside the final file and swap it in, so a crash leaves either
+        # the old file or the new one complete, never a half-written column
+        final = self._column_path(name)
+        column = np.lib.format.open_memmap(final + '.tmp', mode='w+',
+                                           dtype=COLUMNS[name], shape=(capacity,))
+        column[:] = np.nan
+        if data is not None:
+            column[:len(data)] = data
+        column.flush()
+        del column
+        os.replace(final + '.tmp', final)
+
+    def open(self):
+        if self.columns is None:
+            self.columns = {name: np.load(self._column_path(name), mmap_mode='r+') for name in COLUMNS}
+
+    def close(self):
+        if self.path and self.columns is not None:
+            self.flush()
+            self.columns = None
+
+    @contextlib.contextmanager
+    def opened(self):
+        """Map the columns for the duration of a query, unless already open."""
+        was_open = self.columns is not None
+        self.open()
+        try:
+            yield self
+        finally:
+            if not was_open:
+                self.close()
+
+    def _grow(self):
+        capacity = 2 * len(self.columns['t'])
+        for name in COLUMNS:
+            data = self.columns[name][:self.length]
+            if not self.path:
+                grown = self._empty_column(name, capacity)
+                grown[:self.length] = data
+                self.columns[name] = grown
+                continue
+            data = np.array(data)
+            self.columns[name] = None  # Release the old mapping before replacing its file
+            self._write_column(name, capacity, data)
+            self.columns[name] = np.load(self._column_path(name), mmap_mode='r+')
+
+    def append(self, timestamp, x, y):
+        self.open()
+        if self.length == len(self.columns['t']):
+            self._grow()
+
+        self.levels.clear()
+        n = self.length
+        self.columns['t'][n] = timestamp
+        self.columns['x'][n] = x
+        self.columns['y'][n] = y
+        self.length += 1
+        self.last_timestamp = timestamp
+
+    def last(self):
+        return self.last_timestamp
+
+    def index_range(self, start=None, end=None):
+        t = self.columns['t'][:self.length]
+        i0 = 0 if start is None else int(np.searchsorted(t, start, side='left'))
+        i1 = self.length if end is None else int(np.searchsorted(t, end, side='right'))
+        return i0, i1
+
+    def slice(self, i0, i1):
+        return tuple(self.columns[name][i0:i1] for name in COLUMNS)
+
+    def downsampled(self, level, i0, i1):
+        """Rows i0:i1 as (t, x, y) averaged over buckets of 2**level fixes.
+
+        Every bucket lies inside i0:i1. Sealed partitions reuse whole-partition
+        levels for the aligned middle and only average the two ragged edges.
+        """
+        size = 2 ** level
+        b0, b1 = -(-i0 // size), i1 // size  # Cached buckets fully inside the range
+        if not self.sealed or level == 0 or b0 >= b1:
+            return bucket_means(self.slice(i0, i1), size)
+
+        if level not in self.levels:
+            self.levels[level] = bucket_means(self.slice(0, self.length), size)
+        head = bucket_means(self.slice(i0, b0 * size), size)
+        middle = tuple(column[b0:b1] for column in self.levels[level])
+        tail = bucket_means(self.slice(b1 * size, i1), size)
+        return tuple(np.concatenate(parts) for parts in zip(head, middle, tail))
+
+    def flush(self):
+        for column in (self.columns or {}).values():
+            if isinstance(column, np.memmap):
+                column.flush()
+
+
+class PositionHistory:
+    def __init__(self, directory=None, partition_seconds=3600, capacity=4096):
+        self.directory = directory
+        self.partition_seconds = partition_seconds
+        self.capacity = capacity  # Initial rows per partition; doubles when full
+        self.devices = {}  # Device -> {partition index: Partition}
+
+        if directory and os.path.isdir(directory):
+            for device_dir in os.listdir(directory):
+                device_path = os.path.join(directory, device_dir)
+                partitions = {}
+                for name in os.listdir(device_path):
+                    path = os.path.join(device_path, name)
+                    if not name.isdigit():
+                        continue
+                    if not Partition.is_complete(path):
+                        # Interrupted while being created, so it holds no fixes
+                        print(f"Skipping incomplete history partition {path}")
+                        continue
+                    partitions[int(name)] = Partition(path)
+                # Only the newest partition can still be appended to
+                newest = max(partitions, default=None)
+                for index, partition in partitions.items():
+                    partition.sealed = index != newest
+                self.devices[unquote(device_dir)] = partitions
+
+    def _partition_path(self, device, index):
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, quote(device, safe=''), str(index))
+
+    def append(self, device, timestamp, x, y):
+        partitions = self.devices.setdefault(device, {})
+        index = int(timestamp // self.partition_seconds)
+        if partitions:
+            latest = partitions[max(partitions)]
+            if index < max(partitions) or (latest.length and timestamp < latest.last()):
+                raise ValueError(f"Position history for {device} is append-only; "
+                                 f"got timestamp {timestamp} after {latest.last()}")
+        if index not in partitions:
+            for partition in partitions.values():
+                partition.sealed = True
+                partition.close()
+            partitions[index] = Partition(self._partition_path(device, index), self.capacity)
+        partitions[index].append(timestamp, x, y)
+
+    def _overlapping(self, device, start, end):
+        partitions = self.devices.get(device, {})
+        for index in sorted(partitions):
+            partition_start = index * self.partition_seconds
+            if start is not None and partition_start + self.partition_seconds <= start:
+                continue
+            if end is not None and partition_start > end:
+                break
+            yield partitions[index]
+
+    def last_timestamp(self, device):
+        partitions = self.devices.get(device)
+        if not partitions:
+            return None
+        return partitions[max(partitions)].last()
+
+    def query(self, device, start=None, end=None):
+        """Return (t, x, y) arrays for fixes with start <= t <= end."""
+        slices = []
+        for partition in self._overlapping(device, start, end):
+            with partition.opened():
+                slices.append(tuple(np.array(column) for column in
+                                    partition.slice(*partition.index_range(start, end))))
+        if not slices:
+            return tuple(np.empty(0, dtype=dtype) for dtype in COLUMNS.values())
+        return tuple(np.concatenate(column) for column in zip(*slices))
+
+    def trail(self, device, start=None, end=None, max_points=500):
+        """Like query(), averaged down to roughly max_points for drawing."""
+        ranges = []
+        for partition in self._overlapping(device, start, end):
+            with partition.opened():
+                ranges.append((partition, partition.index_range(start, end)))
+        total = sum(i1 - i0 for _, (i0, i1) in ranges)
+        level = max(0, math.ceil(math.log2(total / max_points))) if total > max_points else 0
+
+        slices = []
+        for partition, (i0, i1) in ranges:
+            if i1 <= i0:
+                continue
+            with partition.opened():
+                slices.append(tuple(np.array(column) for column in partition.downsampled(level, i0, i1)))
+        if not slices:
+            return tuple(np.empty(0) for _ in COLUMNS)
+        return tuple(np.concatenate(column) for column in zip(*slices))
+
+    def dwell_times(self, device, zones, start=None, end=None, max_gap=5.0):
+        """Seconds spent in each zone, given zones as {name: (x_min, y_min, x_max, y_max)}.
+
+        Each fix counts until the next one; gaps longer than max_gap seconds
+        (tracker off, device out of range) are not counted.
+        """
+        t, x, y = self.query(device, start, end)
+        dt = np.diff(t)
+        dt[dt > max_gap] = 0.0
+        x, y = x[:-1], y[:-1]
+
+        dwell = {}
+        for name, (x_min, y_min, x_max, y_max) in zones.items():
+            inside = (x >= x_min) & (x < x_max) & (y >= y_min) & (y < y_max)
+            dwell[name] = float(dt[inside].sum())
+        return dwell
+
+    def flush(self):
+        for partitions in self.devices.values():
+            for partition in partitions.values():
+                partition.flush()